@@ -1,13 +1,67 @@
 # plugin_scanner.py
+"""Plugin folder scanning and caching for the REAPER MCP server.
 
+Thread safety: the scan result is an immutable tuple published with a single
+reference assignment (atomic under CPython's GIL), so readers take no lock.
+Only rescans are serialized, via PluginScanner._rescan_lock.
+"""
+
+import json
+import logging
 import os
+import tempfile
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import threading
-from typing import List, Dict, Optional
+from typing import Any, Callable, Iterator, List, Dict, Optional, Tuple
 from pedalboard import load_plugin  # Pedalboard can load VST3/AU
 # Note: this only verifies plugin files load-able, not full metadata extraction
 # You might need to inspect plugin metadata separately if required.
 
+logger = logging.getLogger(__name__)
+
+# Extensions of bundle-style plugins (directories) and loose plugin files
+_BUNDLE_EXTS = ('.vst3', '.component', '.vst')
+_FILE_EXTS = ('.vst3', '.vst', '.component', '.au', '.so', '.dylib')
+# Folders that can't hold plugins of their own (bundle internals, archive junk)
+_SKIP_DIRS = frozenset({"contents", "resources", "__macosx"})
+# dir_mtimes value for a directory that couldn't be stat'ed/listed: never
+# matches a real st_mtime_ns, so the folder is always re-walked next time
+_UNREADABLE_MTIME = -1
+# Bump when the cache file layout or the per-plugin entry keys change
+_CACHE_FILE_VERSION = 1
+# Keys every cached plugin entry carries (see PluginScanner._record)
+_ENTRY_KEYS = frozenset({"name", "path", "plugin_type", "vendor", "category", "is_instrument"})
+# Folder names whose child folder is used as a loose plugin category
+_CATEGORY_PARENTS = frozenset({"plug-ins", "plugins", "vst3", "vst", "components"})
+
+
+def type_from_path(path: str) -> str:
+    """Best-effort plugin format from a plugin path's extension."""
+    lower = path.lower()
+    if lower.endswith(".vst3"):
+        return "VST3"
+    if lower.endswith(".vst"):
+        return "VST"
+    if lower.endswith(".component") or lower.endswith(".au"):
+        return "AU"
+    if lower.endswith(".dll"):
+        return "VST"
+    if lower.endswith(".so") or lower.endswith(".dylib"):
+        return "VST/Other"
+    return ""
+
+
+def category_from_path(path: str) -> Optional[str]:
+    """Take the folder under Plug-Ins/VST3/etc. as a loose category."""
+    parts = os.path.normpath(path).split(os.sep)
+    for i in range(len(parts) - 1):
+        if parts[i].lower() in _CATEGORY_PARENTS:
+            return parts[i + 1]
+    return None
+
+
 class PluginScanner:
     """
     Scans standard plugin folders using Pedalboard, caches the list,
@@ -16,20 +70,37 @@ class PluginScanner:
     def __init__(self,
                  plugin_paths: Optional[List[str]] = None,
                  cache_ttl_seconds: int = 300,
-                 validate_plugins: bool = False):
+                 validate_plugins: bool = False,
+                 cache_file: Optional[str] = "~/.cache/reaper-mcp/plugins.json",
+                 max_cache_ttl_seconds: int = 24 * 60 * 60):
         """
         :param plugin_paths: list of folders to scan (if None, uses default folders per OS)
         :param cache_ttl_seconds: time to keep cache valid before auto-rescan
         :param validate_plugins: if True, attempt to load each plugin via Pedalboard (slower)
+        :param cache_file: JSON file persisting scan results across restarts (None disables)
+        :param max_cache_ttl_seconds: cap for the TTL, which doubles after each unchanged rescan
         """
         if plugin_paths is None:
             plugin_paths = self._default_paths()
         self.plugin_paths = plugin_paths
         self.cache_ttl_seconds = cache_ttl_seconds
+        self._base_ttl_seconds = cache_ttl_seconds
+        self.max_cache_ttl_seconds = max_cache_ttl_seconds
+        self._cache_signature: Optional[int] = None  # hash of sorted plugin paths
         self.validate_plugins = validate_plugins
         self._cache_timestamp: float = 0.0
-        self._cache: List[Dict[str, str]] = []  # each dict: { "name": str, "path": str }
-        self._lock = threading.Lock()
+        # Snapshot tuple, swapped wholesale on rescan so readers never copy.
+        # Only the tuple is immutable: the dicts in it are shared with every
+        # caller and must be treated as read-only.
+        self._cache: Tuple[Dict[str, Any], ...] = ()  # each dict: { "name": str, "path": str, ... }
+        self._rescan_lock = threading.Lock()  # single-flight guard for _rescan
+        # folder -> ({walked dir: st_mtime_ns}, entries) from the last walk
+        self._folder_state: Dict[str, Tuple[Dict[str, int], List[Dict[str, Any]]]] = {}
+        self.cache_file = os.path.expanduser(cache_file) if cache_file else None
+        self._saved_disk_key: Optional[int] = None  # _disk_key() of what cache_file holds
+        # cache_file is read on first use (ensure_cache), not here: the server
+        # builds its scanner at import time and that load stats every saved dir
+        self._disk_cache_loaded = False
 
     def _default_paths(self) -> List[str]:
         # Define common plugin install paths for macOS/Windows/Linux
@@ -56,85 +127,263 @@ class PluginScanner:
         real_paths = [p for p in paths if os.path.isdir(p)]
         return real_paths
 
-    def _scan_folder(self, folder: str) -> List[Dict[str, str]]:
+    def _record(self, results_append: Callable[[Dict[str, Any]], None], name: str, full: str):
+        """Append a plugin entry (with derived metadata), optionally validating it first."""
+        if self.validate_plugins:
+            try:
+                # Attempt to load plugin to check it's valid
+                plugin = load_plugin(full)
+                name = plugin.plugin_name if hasattr(plugin, 'plugin_name') else name
+            except Exception:
+                # skip invalid/broken plugins
+                return
+        results_append({
+            "name": name,
+            "path": full,
+            "plugin_type": type_from_path(full),
+            "vendor": None,
+            "category": category_from_path(full),
+            "is_instrument": False,  # pedalboard doesn't expose instrument flag
+        })
+
+    def _scan_folder(self, folder: str,
+                     dir_mtimes: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
         """
         Scan one folder for plugin files, try loading via Pedalboard to validate,
-        then return list of {'name':.., 'path': ..}
+        then return list of {'name':.., 'path': .., ...metadata}
+
+        :param dir_mtimes: if given, filled with {dir_path: st_mtime_ns} for every
+                           directory walked (used to skip unchanged folders later);
+                           unreadable directories get _UNREADABLE_MTIME
         """
-        print(f"[plugin_scan] scanning {folder}")
+        logger.debug("[plugin_scan] scanning %s", folder)
         results = []
-        for root, dirs, files in os.walk(folder):
-            # Log plugin subdirectories encountered to aid troubleshooting
-            plugin_dirs = [d for d in dirs if d and not d.startswith(".")]
-            if plugin_dirs:
-                print(f"[plugin_scan] dirs in {root}: {', '.join(plugin_dirs)}")
-
-            # Attempt to load bundle-style plugins before descending (macOS .vst3/.component)
-            for d in list(dirs):
-                if d.lower().endswith(('.vst3', '.component', '.vst')):
-                    full = os.path.join(root, d)
-                    if self.validate_plugins:
-                        try:
-                            plugin = load_plugin(full)
-                            name = plugin.plugin_name if hasattr(plugin, 'plugin_name') else d
-                            results.append({"name": name, "path": full})
-                        except Exception:
-                            # skip invalid/broken plugins
-                            pass
-                    else:
-                        # Fast path: record without loading
-                        results.append({"name": d, "path": full})
-                    # prevent duplicate scans by not descending into the bundle
-                    dirs.remove(d)
-
-            for fn in files:
-                # filter common plugin file extensions
-                if fn.lower().endswith(('.vst3', '.vst', '.component', '.au', '.so', '.dylib')):
-                    full = os.path.join(root, fn)
-                    if self.validate_plugins:
-                        try:
-                            # Attempt to load plugin to check it's valid
-                            plugin = load_plugin(full)
-                            name = plugin.plugin_name if hasattr(plugin, 'plugin_name') else fn
-                            results.append({"name": name, "path": full})
-                        except Exception:
-                            # skip invalid/broken plugins
-                            continue
-                    else:
-                        results.append({"name": fn, "path": full})
+        results_append = results.append
+        # os.scandir is used on every platform rather than os.fwalk: fwalk's
+        # dir fds don't help here because Pedalboard's load_plugin only takes a
+        # path, and scandir already yields full paths via DirEntry.path.
+        pending = deque([folder])
+        while pending:
+            dir_path = pending.popleft()
+            try:
+                if dir_mtimes is not None:
+                    # stat before listing so a concurrent change shows up next time
+                    dir_mtimes[dir_path] = os.stat(dir_path).st_mtime_ns
+                with os.scandir(dir_path) as it:
+                    entries = list(it)
+            except OSError:
+                # unreadable (or missing/unmounted) folder: skip it rather than
+                # abort the whole scan, but make sure it's retried next rescan
+                if dir_mtimes is not None:
+                    dir_mtimes[dir_path] = _UNREADABLE_MTIME
+                continue
+            for entry in entries:
+                name = entry.name
+                lower = name.lower()
+                if entry.is_dir():
+                    # Bundle-style plugins (macOS .vst3/.component) are recorded
+                    # as-is; we don't descend into them to avoid duplicate scans
+                    if lower.endswith(_BUNDLE_EXTS):
+                        self._record(results_append, name, entry.path)
+                    elif not (entry.is_symlink()  # like os.walk, don't follow symlinked folders
+                              or name.startswith(".")
+                              or lower in _SKIP_DIRS):
+                        pending.append(entry.path)
+                elif entry.is_file():
+                    # filter common plugin file extensions
+                    if lower.endswith(_FILE_EXTS):
+                        self._record(results_append, name, entry.path)
         return results
 
-    def _rescan(self):
-        """Perform a full scan of plugin_paths and populate cache."""
+    @staticmethod
+    def _dirs_unchanged(dir_mtimes: Dict[str, int]) -> bool:
+        """True if every recorded directory still has its recorded mtime."""
+        try:
+            return all(os.stat(d).st_mtime_ns == m for d, m in dir_mtimes.items())
+        except OSError:
+            return False  # a walked directory vanished
+
+    def _scan_folder_cached(self, folder: str) -> List[Dict[str, Any]]:
+        """
+        Reuse the previous result for folder if none of the directories it
+        walked have a new mtime (entries added/removed/renamed); else rescan it.
+        """
+        state = self._folder_state.get(folder)
+        if state is not None:
+            dir_mtimes, entries = state
+            if self._dirs_unchanged(dir_mtimes):
+                return entries
+        dir_mtimes = {}
+        entries = self._scan_folder(folder, dir_mtimes)
+        self._folder_state[folder] = (dir_mtimes, entries)
+        return entries
+
+    def _rescan(self, full: bool = False):
+        """
+        Scan plugin_paths and populate cache. Folders whose directories are
+        unchanged since the last scan are reused unless full is True.
+        """
+        if full:
+            self._folder_state = {}
         combined = []
-        for p in self.plugin_paths:
+        # Folders are independent I/O-bound walks, so scan them concurrently.
+        # Results are collected in plugin_paths order to keep the cache stable.
+        with ThreadPoolExecutor(max_workers=min(8, len(self.plugin_paths) or 1)) as ex:
+            futures = [ex.submit(self._scan_folder_cached, p) for p in self.plugin_paths]
+            for future in futures:
+                try:
+                    combined.extend(future.result())
+                except Exception:
+                    continue
+        self._cache = tuple(combined)
+        self._cache_timestamp = time.time()
+        self._update_ttl(self._signature(combined))
+        self._save_disk_cache()
+
+    @staticmethod
+    def _signature(plugins) -> int:
+        return hash(tuple(sorted(entry["path"] for entry in plugins)))
+
+    def _update_ttl(self, signature: int):
+        """Back off the TTL while installs are stable; reset it when they change."""
+        # An empty cache is rescanned on every call regardless of TTL, so only
+        # back off once there's something cached
+        if self._cache and signature == self._cache_signature:
+            self.cache_ttl_seconds = min(self.cache_ttl_seconds * 2, self.max_cache_ttl_seconds)
+        else:
+            self.cache_ttl_seconds = self._base_ttl_seconds
+        self._cache_signature = signature
+
+    def _load_disk_cache(self):
+        """
+        Seed the cache from cache_file. Each folder's saved result is reused
+        only if every directory it walked still has the recorded mtime; the
+        cache is served as fresh only if that holds for all plugin_paths.
+        """
+        if not self.cache_file:
+            return
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if (not isinstance(data, dict)
+                or data.get("version") != _CACHE_FILE_VERSION
+                or data.get("plugin_paths") != self.plugin_paths
+                or data.get("validate_plugins") != self.validate_plugins):
+            return
+        folders = data.get("folders") or {}
+        combined = []
+        complete = True
+        try:
+            for p in self.plugin_paths:
+                state = folders.get(p)
+                if not state or not self._dirs_unchanged(state["dirs"]):
+                    complete = False
+                    continue
+                entries = state["plugins"]
+                if not all(isinstance(e, dict) and _ENTRY_KEYS <= e.keys() for e in entries):
+                    complete = False
+                    continue
+                self._folder_state[p] = (state["dirs"], entries)
+                combined.extend(entries)
+        except (KeyError, TypeError, AttributeError):
+            # malformed cache file: ignore it entirely
+            self._folder_state = {}
+            return
+        if not complete:
+            # Unchanged folders stay seeded so the first rescan skips them
+            return
+        self._cache = tuple(combined)
+        self._cache_timestamp = time.time()
+        self._cache_signature = self._signature(self._cache)
+        self._saved_disk_key = self._disk_key()
+
+    def _disk_key(self) -> int:
+        """Hash of the state _save_disk_cache would write (plugins + dir mtimes)."""
+        dirs = tuple(sorted((p, tuple(sorted(d.items())))
+                            for p, (d, _) in self._folder_state.items()))
+        return hash((self._cache_signature, dirs))
+
+    def _save_disk_cache(self):
+        """Atomically write per-folder scan state to cache_file (best effort)."""
+        if not self.cache_file:
+            return
+        key = self._disk_key()
+        if key == self._saved_disk_key:
+            return  # file already holds this exact state
+        payload = {
+            "version": _CACHE_FILE_VERSION,
+            "plugin_paths": self.plugin_paths,
+            "validate_plugins": self.validate_plugins,
+            "folders": {
+                p: {"dirs": dir_mtimes, "plugins": entries}
+                for p, (dir_mtimes, entries) in self._folder_state.items()
+            },
+        }
+        try:
+            cache_dir = os.path.dirname(self.cache_file) or "."
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
             try:
-                scanned = self._scan_folder(p)
-                combined.extend(scanned)
-            except Exception:
-                continue
-        with self._lock:
-            self._cache = combined
-            self._cache_timestamp = time.time()
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(payload, f)
+                os.replace(tmp, self.cache_file)
+                self._saved_disk_key = key
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError as exc:
+            logger.warning("[plugin_scan] could not write cache file %s: %s", self.cache_file, exc)
+
+    def _is_stale(self) -> bool:
+        return (time.time() - self._cache_timestamp) > self.cache_ttl_seconds or not self._cache
 
     def ensure_cache(self):
-        """Ensure cache is fresh: if stale, trigger rescan."""
-        now = time.time()
-        if (now - self._cache_timestamp) > self.cache_ttl_seconds or not self._cache:
-            # Rescan outside blocking path
-            self._rescan()
+        """Ensure cache is fresh: if stale, trigger rescan (one thread at a time)."""
+        if not self._disk_cache_loaded:
+            with self._rescan_lock:
+                if not self._disk_cache_loaded:
+                    self._load_disk_cache()
+                    self._disk_cache_loaded = True
+        if not self._is_stale():
+            return
+        if self._cache:
+            # Another thread is already rescanning: serve the previous cache
+            if not self._rescan_lock.acquire(blocking=False):
+                return
+        else:
+            # Nothing to serve yet, so wait for the in-flight scan
+            self._rescan_lock.acquire()
+        try:
+            # Re-check: the scan may have completed while we waited
+            if self._is_stale():
+                self._rescan()
+        finally:
+            self._rescan_lock.release()
 
-    def get_installed_plugins(self) -> List[Dict[str, str]]:
+    def get_installed_plugins(self) -> Tuple[Dict[str, Any], ...]:
         """
-        Return the cached list of plugin dictionaries.
-        Each dict has keys: 'name', 'path'
+        Return the cached tuple of plugin dictionaries (a stable snapshot).
+        Each dict has keys: 'name', 'path', 'plugin_type', 'vendor',
+        'category', 'is_instrument'. The dicts are the cache's own objects,
+        not copies: don't mutate them (copy first if you need to).
         """
         self.ensure_cache()
-        with self._lock:
-            return list(self._cache)
-
-    def force_scan(self):
-        """Force a fresh scan regardless of TTL."""
-        self._rescan()
-        with self._lock:
-            return list(self._cache)
+        return self._cache
+
+    def iter_installed_plugins(self) -> Iterator[Dict[str, Any]]:
+        """
+        Iterate cached plugin dictionaries without copying (read-only).
+        Not a generator: the cache is refreshed when this is called, so any
+        rescan happens before the caller starts consuming (e.g. streaming).
+        """
+        self.ensure_cache()
+        return iter(self._cache)
+
+    def force_scan(self) -> Tuple[Dict[str, Any], ...]:
+        """Force a fresh scan regardless of TTL; returns the same shared, read-only entries."""
+        with self._rescan_lock:
+            self._disk_cache_loaded = True  # a full rescan supersedes the file
+            self._rescan(full=True)
+        return self._cache
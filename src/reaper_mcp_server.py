@@ -2,27 +2,53 @@
 
 Expose REAPER actions as MCP tools so LM Studio (or any MCP client)
 can list capabilities and call them over the MCP HTTP transport.
+
+TOOL_HANDLERS and TOOL_SPECS are built once at import and only read
+afterwards; dict lookups on str keys are atomic under CPython, so the HTTP
+handlers use them without locking.
 """
+import functools
+import json
+import logging
 import re
 import pprint
+from contextvars import ContextVar
+from itertools import islice
 from typing import Any, Dict, List, Optional
-import os
 
 from plugin_helpers import PluginScanner
 import threading
 
 # HTTP exposure (for clients that probe GET /)
 try:
-    from fastapi import FastAPI
+    from fastapi import FastAPI, Query
+    from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
     from pydantic import BaseModel
 except ImportError:  # pragma: no cover - FastAPI optional
-    FastAPI = None  # type: ignore
+    FastAPI = Query = None  # type: ignore
+    JSONResponse = ORJSONResponse = Response = StreamingResponse = None  # type: ignore
     BaseModel = None  # type: ignore
 
+# Faster JSON encoding for HTTP responses when available
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson optional
+    orjson = None  # type: ignore
+
 import reapy
 from mcp.server.fastmcp import FastMCP
 from reapy import reascript_api as RPR
 
+logger = logging.getLogger(__name__)
+
+
+def _dumps(obj: Any) -> bytes:
+    """Serialize obj to UTF-8 JSON bytes, preferring orjson."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
+
 # MCP server instance (note: FastMCP init in this SDK does not accept description kw)
 server = FastMCP("reaper-mcp")
 _plugin_scanner = PluginScanner()
@@ -32,7 +58,8 @@ def _kickoff_plugin_scan_async():
     """Start an async scan on server startup and log the result."""
     def _scan():
         try:
-            plugins = _plugin_scanner.force_scan()
+            # Reuses the on-disk cache when it's still valid, else walks the folders
+            plugins = _plugin_scanner.get_installed_plugins()
             print(f"[plugin_scan] Initial scan complete: found {len(plugins)} plugins")
         except Exception as exc:  # pragma: no cover
             print(f"[plugin_scan] Initial scan failed: {exc}")
@@ -40,20 +67,46 @@ def _kickoff_plugin_scan_async():
     threading.Thread(target=_scan, daemon=True).start()
 
 
+# Per-call memo of {"project_id": ..., "tracks": {index: MediaTrack}}; None
+# outside a tool call. Handles can go stale between calls, so it never outlives one.
+_track_memo: ContextVar[Optional[Dict[str, Any]]] = ContextVar("_track_memo", default=None)
+
+
+def _track_scope(fn):
+    """Decorator: give each tool call its own track-pointer memo, dropped on return."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _track_memo.set({"project_id": None, "tracks": {}})
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _track_memo.reset(token)
+    return wrapper
+
+
 def get_track_pointer(track_index: int):
     """Helper: resolve a track index to a REAPER MediaTrack pointer."""
-    project = reapy.Project()  # current project
-    track_id = RPR.GetTrack(project.id, track_index)
-    return track_id
+    memo = _track_memo.get()
+    if memo is None:
+        return RPR.GetTrack(reapy.Project().id, track_index)
+    tracks = memo["tracks"]
+    if track_index not in tracks:
+        if memo["project_id"] is None:
+            memo["project_id"] = reapy.Project().id  # current project
+        tracks[track_index] = RPR.GetTrack(memo["project_id"], track_index)
+    return tracks[track_index]
 
 
 @server.tool(description="Insert a new track at the specified index.")
+@_track_scope
 def create_track(index: int, want_defaults: bool = True) -> dict:
     """Create a new track and return its index and name."""
-    RPR.InsertTrackAtIndex(index, want_defaults)
-    RPR.TrackList_AdjustWindows(False)
-    track_ptr = get_track_pointer(index)
-    name_ret = RPR.GetSetMediaTrackInfo_String(track_ptr, "P_NAME", "", False)
+    # Batch the ReaScript calls into one dist-API session
+    with reapy.inside_reaper():
+        RPR.InsertTrackAtIndex(index, want_defaults)
+        RPR.TrackList_AdjustWindows(False)
+        track_ptr = get_track_pointer(index)
+        name_ret = RPR.GetSetMediaTrackInfo_String(track_ptr, "P_NAME", "", False)
     track_name = name_ret[3] if name_ret[0] else ""
     return {
         "result": f"Track {index + 1} created",
@@ -63,6 +116,7 @@ def create_track(index: int, want_defaults: bool = True) -> dict:
 
 
 @server.tool(description="Name/rename a track.")
+@_track_scope
 def name_track(track_index: int, new_name: str) -> dict:
     """Set a track's name (title)."""
     track_ptr = get_track_pointer(track_index)
@@ -71,6 +125,7 @@ def name_track(track_index: int, new_name: str) -> dict:
 
 
 @server.tool(description="Create a routing send from one track to another.")
+@_track_scope
 def create_send(src_track_index: int, dest_track_index: int) -> dict:
     """Create a send between two tracks and return the send index."""
     src_ptr = get_track_pointer(src_track_index)
@@ -91,6 +146,7 @@ def create_send(src_track_index: int, dest_track_index: int) -> dict:
 
 
 @server.tool(description="Configure an existing send (volume/pan/mode/channels).")
+@_track_scope
 def config_send(
     src_track_index: int,
     send_index: int,
@@ -100,19 +156,22 @@ def config_send(
     send_mode: Optional[int] = None,
 ) -> dict:
     """Update parameters on an existing send."""
-    track_ptr = get_track_pointer(src_track_index)
-    if volume is not None:
-        RPR.SetTrackSendInfo_Value(track_ptr, 0, send_index, "D_VOL", volume)
-    if pan is not None:
-        RPR.SetTrackSendInfo_Value(track_ptr, 0, send_index, "D_PAN", pan)
-    if dest_channel is not None:
-        RPR.SetTrackSendInfo_Value(track_ptr, 0, send_index, "I_DSTCHAN", float(dest_channel))
-    if send_mode is not None:
-        RPR.SetTrackSendInfo_Value(track_ptr, 0, send_index, "I_SENDMODE", float(send_mode))
+    # Batch the (up to four) parameter writes into one dist-API session
+    with reapy.inside_reaper():
+        track_ptr = get_track_pointer(src_track_index)
+        if volume is not None:
+            RPR.SetTrackSendInfo_Value(track_ptr, 0, send_index, "D_VOL", volume)
+        if pan is not None:
+            RPR.SetTrackSendInfo_Value(track_ptr, 0, send_index, "D_PAN", pan)
+        if dest_channel is not None:
+            RPR.SetTrackSendInfo_Value(track_ptr, 0, send_index, "I_DSTCHAN", float(dest_channel))
+        if send_mode is not None:
+            RPR.SetTrackSendInfo_Value(track_ptr, 0, send_index, "I_SENDMODE", float(send_mode))
     return {"result": "Send updated", "send_index": send_index, "src_track": src_track_index}
 
 
 @server.tool(description="Insert an FX plugin on a track by name.")
+@_track_scope
 def add_fx(track_index: int, fx_name: str, record_fx: bool = False) -> dict:
     """Add an FX to a track."""
     track_ptr = get_track_pointer(track_index)
@@ -126,21 +185,40 @@ def add_fx(track_index: int, fx_name: str, record_fx: bool = False) -> dict:
     }
 
 
+# "*Track*" functions whose int args are indices/counts, not tracks to resolve
+_NO_TRACK_PTR_FUNCS = frozenset({"InsertTrackAtIndex", "InsertTrackInProject"})
+
+
+_RPR_FUNCS: Dict[str, Any] = {}  # memoized ReaScript lookups (hits only)
+
+
+def _resolve_rpr(name: str):
+    """
+    Memoized ReaScript function lookup. Misses aren't cached:
+    reapy.connect()/reconnect() reload reascript_api in place, so a name
+    missing before REAPER was reachable can appear later.
+    """
+    func = _RPR_FUNCS.get(name)
+    if func is None:
+        func = getattr(RPR, name, None)
+        if func is not None and len(_RPR_FUNCS) < 256:
+            _RPR_FUNCS[name] = func
+    return func
+
+
 @server.tool(description="Call any ReaScript function by name with args (advanced).")
+@_track_scope
 def call_api(function: str, args: Optional[List] = None) -> dict:
     """Invoke an arbitrary REAPER API function by name."""
-    func = getattr(RPR, function, None)
+    func = _resolve_rpr(function)
     if not func:
         return {"error": f"Function {function} not found in ReaScript API"}
 
+    # Whether int args are track indices depends only on the function name
+    needs_track_ptr = "Track" in function and function not in _NO_TRACK_PTR_FUNCS
     converted_args = []
     for arg in args or []:
-        if (
-            isinstance(arg, int)
-            and function not in ["InsertTrackAtIndex", "InsertTrackInProject"]
-            and "Track" in function
-            and arg >= 0
-        ):
+        if needs_track_ptr and isinstance(arg, int) and arg >= 0:
             try:
                 track_ptr = get_track_pointer(arg)
                 converted_args.append(track_ptr)
@@ -156,6 +234,12 @@ def call_api(function: str, args: Optional[List] = None) -> dict:
         return {"error": str(exc)}
 
 
+# Vendor is the trailing "(...)" group of an FX ident
+_VENDOR_RE = re.compile(r"\(([^()]+)\)\s*$")
+# VSTi/AUi plugin type, a "vsti" prefix, or an instrument/synth hint anywhere
+_INSTR_RE = re.compile(r"^(?:vsti|\s*(?:vsti|aui)\s*(?::|\Z))|instrument|synth", re.I)
+
+
 def _parse_fx_metadata(name: str, ident: str) -> Dict[str, Any]:
     """Lightweight parsing of FX ident string into format/vendor/category hints."""
     ident = ident or ""
@@ -164,7 +248,7 @@ def _parse_fx_metadata(name: str, ident: str) -> Dict[str, Any]:
 
     # Vendor is usually the trailing (...) group
     vendor = None
-    vendor_match = re.search(r"\(([^()]+)\)\s*$", rest)
+    vendor_match = _VENDOR_RE.search(rest)
     if vendor_match:
         vendor = vendor_match.group(1).strip()
 
@@ -175,13 +259,7 @@ def _parse_fx_metadata(name: str, ident: str) -> Dict[str, Any]:
         # Take leading path component as a best-effort category
         category = rest.split("/", 1)[0].strip()
 
-    lower_ident = ident.lower()
-    is_instrument = (
-        plugin_type.upper() in {"VSTI", "AUI"}
-        or lower_ident.startswith("vsti")
-        or "instrument" in lower_ident
-        or "synth" in lower_ident
-    )
+    is_instrument = _INSTR_RE.search(ident) is not None
 
     return {
         "name": name,
@@ -193,59 +271,39 @@ def _parse_fx_metadata(name: str, ident: str) -> Dict[str, Any]:
     }
 
 
+def _fx_meta(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a (shared, read-only) scanner entry to a fresh list_installed_fx dict."""
+    return {
+        "name": entry["name"],
+        "ident": entry["path"],
+        "plugin_type": entry["plugin_type"],
+        "vendor": entry["vendor"],
+        "category": entry["category"],
+        "is_instrument": entry["is_instrument"],
+    }
+
+
 @server.tool(description="List installed FX/plugins with basic metadata.")
 def list_installed_fx(refresh_js: bool = False, limit: Optional[int] = None) -> dict:
     """Enumerate installed FX using PluginScanner; cache results after first scan."""
-
-    def type_from_path(path: str) -> str:
-        lower = path.lower()
-        if lower.endswith(".vst3"):
-            return "VST3"
-        if lower.endswith(".vst"):
-            return "VST"
-        if lower.endswith(".component") or lower.endswith(".au"):
-            return "AU"
-        if lower.endswith(".dll"):
-            return "VST"
-        if lower.endswith(".so") or lower.endswith(".dylib"):
-            return "VST/Other"
-        return ""
-
-    def category_from_path(path: str) -> Optional[str]:
-        parts = os.path.normpath(path).split(os.sep)
-        # Take parent folder under Plug-Ins as a loose category
-        for i, part in enumerate(parts):
-            if part.lower() in {"plug-ins", "plugins", "vst3", "vst", "components"} and i + 1 < len(parts):
-                return parts[i + 1]
-        return None
+    # None means no limit and 0 means no entries; islice rejects negatives
+    if limit is not None and limit < 0:
+        return {"error": f"limit must be >= 0 (got {limit})"}
 
     # On first call or when refresh_js is True, force a scan; otherwise use cached.
     if refresh_js:
         plugins_raw = _plugin_scanner.force_scan()
     else:
-        plugins_raw = _plugin_scanner.get_installed_plugins()
-
-    plugins: List[Dict[str, Any]] = []
-    for entry in plugins_raw:
-        name = entry.get("name", "") or ""
-        path = entry.get("path", "") or ""
-        plugin_type = type_from_path(path)
-        category = category_from_path(path)
-        meta = {
-            "name": name,
-            "ident": path,
-            "plugin_type": plugin_type,
-            "vendor": None,
-            "category": category,
-            "is_instrument": False,  # pedalboard doesn't expose instrument flag
-        }
-        plugins.append(meta)
-        if limit is not None and len(plugins) >= limit:
-            break
+        plugins_raw = _plugin_scanner.iter_installed_plugins()
+
+    # Scanner entries already carry the derived metadata; stop at `limit`
+    # without walking or copying the rest of the snapshot.
+    plugins: List[Dict[str, Any]] = [_fx_meta(e) for e in islice(plugins_raw, limit)]
 
-    # Log summary for debugging
-    sample = plugins[:3]
-    print("[list_installed_fx] collected", len(plugins), "plugins; sample:", pprint.pformat(sample, compact=True))
+    # Log summary for debugging (skip the pformat entirely unless DEBUG is on)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("[list_installed_fx] collected %d plugins; sample: %s",
+                     len(plugins), pprint.pformat(plugins[:3], compact=True))
 
     return {"count": len(plugins), "plugins": plugins}
 
@@ -334,23 +392,45 @@ if FastAPI:
         tool: str
         args: Dict[str, Any] = {}
 
+    _JSONResponseClass = ORJSONResponse if orjson is not None else JSONResponse
+
     app = FastAPI(
         title="REAPER MCP Server",
         description="Lightweight HTTP surface for tool discovery/invocation.",
         version="1.0.0",
+        default_response_class=_JSONResponseClass,
     )
 
+    # GET / and /health are static: serialize them once instead of per request
+    _ROOT_RESPONSE = {
+        "name": "reaper-mcp",
+        "description": "REAPER control via MCP tools.",
+        "tools": TOOL_SPECS,
+    }
+    _ROOT_JSON = _dumps(_ROOT_RESPONSE)
+    _HEALTH_JSON = _dumps({"status": "ok"})
+
     @app.get("/")
     async def root():
-        return {
-            "name": "reaper-mcp",
-            "description": "REAPER control via MCP tools.",
-            "tools": TOOL_SPECS,
-        }
+        return Response(content=_ROOT_JSON, media_type="application/json")
 
     @app.get("/health")
     async def health():
-        return {"status": "ok"}
+        return Response(content=_HEALTH_JSON, media_type="application/json")
+
+    @app.get("/plugins")
+    def list_plugins(limit: Optional[int] = Query(None, ge=0)):
+        """Stream installed plugins as JSON lines (one plugin dict per line)."""
+        # limit is validated and the cache refreshed up front (a sync endpoint,
+        # so a rescan runs in FastAPI's threadpool): once streaming starts the
+        # 200 headers are sent and an error could only truncate the body
+        entries = islice(_plugin_scanner.iter_installed_plugins(), limit)
+
+        def _lines():
+            for entry in entries:
+                yield _dumps(_fx_meta(entry)) + b"\n"
+
+        return StreamingResponse(_lines(), media_type="application/x-ndjson")
 
     @app.post("/call")
     async def call_tool(request: ToolCall):
@@ -359,11 +439,18 @@ if FastAPI:
             return {"error": f"Unknown tool '{request.tool}'"}
         try:
             result = tool_fn(**request.args)
-            return result
         except TypeError as exc:
             return {"error": f"Bad arguments for {request.tool}: {exc}"}
         except Exception as exc:  # pragma: no cover
             return {"error": str(exc)}
+        # Return a Response directly so FastAPI skips jsonable_encoder on
+        # large payloads (e.g. list_installed_fx with thousands of plugins).
+        # Encoding happens here, outside the try above, so an unserializable
+        # result (orjson.JSONEncodeError is a TypeError) isn't misreported.
+        try:
+            return _JSONResponseClass(content=result)
+        except (TypeError, ValueError) as exc:
+            return {"error": f"Could not encode result of {request.tool}: {exc}"}
 
 
 if __name__ == "__main__":
@@ -380,6 +467,16 @@ if __name__ == "__main__":
         help="Transport to run (http|stdio|socket depending on SDK support).",
     )
     args = parser.parse_args()
+    # Per-folder/per-call diagnostics are DEBUG; set MCP_LOG_LEVEL=DEBUG to see them.
+    # FastMCP() already ran basicConfig at import (so a second basicConfig is a
+    # no-op); set the root level directly instead.
+    log_level_name = os.environ.get("MCP_LOG_LEVEL", "INFO").upper()
+    log_level = logging.getLevelName(log_level_name)
+    if not isinstance(log_level, int):
+        print(f"Unknown MCP_LOG_LEVEL '{log_level_name}', using INFO")
+        log_level = logging.INFO
+    logging.basicConfig()  # only adds a handler if FastMCP didn't
+    logging.getLogger().setLevel(log_level)
 
     print(f"Starting MCP server with transport={args.transport} on {args.host}:{args.port}")
     _kickoff_plugin_scan_async()